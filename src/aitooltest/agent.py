@@ -1,22 +1,35 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, PrivateAttr
 from typing import Any, Callable, Dict, List
 from google import genai
 from .definations import ToolDefination
 from .config import LLMConfig
 from .tool_registry import get_tools
 from .token_usage import TokenUsage
+from .resource_usage import command_usage_report
+from .tools import stop_running_commands
+from .routing import ModelTier, RoutingStats, TieredChat, get_model_tiers
+from .code_workers import start_code_workers, stop_code_workers
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from contextlib import contextmanager
 import logging
+import threading
 
 
 class Agent(BaseModel):
     client: genai.Client
     get_user_message: Callable[[], str]
     token_usage: TokenUsage = TokenUsage()
+    routing_stats: RoutingStats = Field(default_factory=RoutingStats)
 
     llm_config: LLMConfig = LLMConfig()
 
+    # Counter for function tools called (visible to user), shared by parallel tool calls
+    _tool_call_counter: Counter = PrivateAttr(default_factory=Counter)
+    # Serialises the interactive retry prompts of parallel tool calls
+    _prompt_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
     model_config = {
         "arbitrary_types_allowed": True
     }
@@ -27,17 +40,31 @@ class Agent(BaseModel):
         and manages the resource clean ups"""
         logging.debug("initializing chat inference endpoint...")
         tools = get_tools()
-        chat_model = self.client.chats.create(
-            model=self.llm_config.MODEL_NAME,
-            config=genai.types.GenerateContentConfig(
+        function_declarations = [tool.to_json() for tool in tools]
+
+        def chat_config(tier: ModelTier) -> genai.types.GenerateContentConfig:
+            """builds the chat config for the given model tier"""
+            return genai.types.GenerateContentConfig(
                 system_instruction="Talk to users like a Chad Gipidii. You are a great problem solver who always helps users with their queries. Use think and plan, step by step, to solve problems before responding.",
                 tools=[
-                    genai.types.Tool(function_declarations=[tool.to_json() for tool in tools])
+                    genai.types.Tool(function_declarations=function_declarations)
                 ],
                 tool_config=genai.types.ToolConfig(
                     function_calling_config=genai.types.FunctionCallingConfig(mode="AUTO")
-                )
+                ),
+                # Only sent when configured, models without thinking support reject any thinking config
+                thinking_config=(
+                    genai.types.ThinkingConfig(thinking_budget=tier.thinking_budget)
+                    if tier.thinking_budget is not None else None
+                ),
             )
+
+        chat_model = TieredChat(
+            client=self.client,
+            tiers=get_model_tiers(self.llm_config),
+            config_factory=chat_config,
+            routing_stats=self.routing_stats,
+            token_usage=self.token_usage,
         )
         try:
             yield chat_model
@@ -52,28 +79,23 @@ class Agent(BaseModel):
         stopping_sequences = set(["q", "quit", "exit", "\\bye"])
         logging.info("Chat with Google Gemini (use '(ctrl-c)' to quit)")
         self.token_usage.start()
+        start_code_workers(self.client, self.llm_config, self.token_usage)
         try:
             with self.run_as_chat_inference() as chat_mode:
                 while True:
                     print("\u001b[94mYou\u001b[0m: ", end="")
                     user_input = self.get_user_message()
                     if len(user_input) == 0 or user_input in stopping_sequences: break
-                    response = chat_mode.send_message(user_input)
-                    self.token_usage.update_usage(response.usage_metadata.total_token_count)
+                    response = chat_mode.send_user_message(user_input)
 
                     # Multi-step tool calling loop
                     while response.function_calls:
-                        tool_calls = response.function_calls
-                        tool_results = []
-                        for tool_call in tool_calls:
-                            tool_result = self.execute_tool_call(chat_mode, tool_call.name, input_args=dict(tool_call.args))
-                            tool_results.append(tool_result)
-                        
+                        tool_results = self.execute_tool_calls(chat_mode, response.function_calls)
+
                         # Send all tool results back to the model in a single message
-                        response = chat_mode.send_message(
+                        response = chat_mode.send_tool_results(
                             ", ".join(str(result) for result in tool_results)
                         )
-                        self.token_usage.update_usage(response.usage_metadata.total_token_count)
 
                     ai_response = getattr(response, "text", "Nothing found...")
                     logging.info("Gemini: %s", str(ai_response))
@@ -88,13 +110,37 @@ class Agent(BaseModel):
             logging.error("an error occured: %s", error_message, exc_info=e)
             raise e
         finally:
+            stop_running_commands()
+            stop_code_workers()
             self.token_usage.stop()
+            self.routing_stats.log_report()
+            command_usage_report.log_report()
 
 
-    def execute_tool_call(self, chat_mode: genai.chats.Chat, name: str, input_args: Dict[str, Any]) -> Any:
-        """Tries to run the tool function and return the output. Handles invalid schema gracefully, with retries and user prompt."""
-        from collections import Counter
+    def execute_tool_calls(self, chat_mode: TieredChat, tool_calls: List[genai.types.FunctionCall]) -> List[Any]:
+        """Runs the tool calls of a single response, concurrently when every tool called is marked `parallel`."""
+        parallel_tools = {t.name for t in get_tools() if t.parallel}
+        if len(tool_calls) > 1 and all(tool_call.name in parallel_tools for tool_call in tool_calls):
+            with ThreadPoolExecutor(max_workers=len(tool_calls)) as executor:
+                return list(executor.map(
+                    lambda tool_call: self.execute_tool_call(chat_mode, tool_call.name, input_args=dict(tool_call.args)),
+                    tool_calls,
+                ))
+        return [
+            self.execute_tool_call(chat_mode, tool_call.name, input_args=dict(tool_call.args))
+            for tool_call in tool_calls
+        ]
 
+
+    def prompt_user(self, message: str) -> str:
+        """Asks the user for input, one prompt at a time even when tool calls run in parallel."""
+        with self._prompt_lock:
+            print(message)
+            return input("> ")
+
+
+    def execute_tool_call(self, chat_mode: TieredChat, name: str, input_args: Dict[str, Any]) -> Any:
+        """Tries to run the tool function and return the output. Handles invalid schema gracefully, with retries and user prompt."""
         logging.debug("\u001b[92mtool\u001b[0m: %s(%s)", name, input_args)
         tools = get_tools()
         tool: ToolDefination | None = next((t for t in tools if t.name == name), None)
@@ -104,11 +150,9 @@ class Agent(BaseModel):
             chat_mode.send_message(error_msg)
             return None
 
-        # Counter for function tools called (visible to user)
-        if not hasattr(self, "_tool_call_counter"):
-            self._tool_call_counter = Counter()
-        self._tool_call_counter[name] += 1
-        print(f"[Tool Call {self._tool_call_counter[name]}] {name}({input_args})")
+        with self._prompt_lock:
+            self._tool_call_counter[name] += 1
+            print(f"[Tool Call {self._tool_call_counter[name]}] {name}({input_args})")
 
         max_attempts = 2
         attempts = 0
@@ -141,8 +185,7 @@ class Agent(BaseModel):
                 chat_mode.send_message(error_message)
                 logging.error(error_message, exc_info=ex)
                 if attempts < max_attempts:
-                    print("Please check/fix the tool arguments. Re-enter input arguments as a dictionary (e.g., {'key': 'value'}):")
-                    user_input_str = input("> ")
+                    user_input_str = self.prompt_user(f"Please check/fix the '{name}' tool arguments. Re-enter input arguments as a dictionary (e.g., {{'key': 'value'}}):")
                     if user_input_str.strip():
                         input_args = parse_input_dict(user_input_str, input_args)
         if tool_input is None:
@@ -164,8 +207,7 @@ class Agent(BaseModel):
                 chat_mode.send_message(error_message)
                 logging.error(error_message, exc_info=ex)
                 if attempts < max_attempts:
-                    print("You may fix input and try again. Re-enter input arguments as a dictionary or press enter for the previous one:")
-                    user_input_str = input("> ")
+                    user_input_str = self.prompt_user(f"You may fix the '{name}' input and try again. Re-enter input arguments as a dictionary or press enter for the previous one:")
                     if user_input_str.strip():
                         input_args = parse_input_dict(user_input_str, input_args)
                         try:
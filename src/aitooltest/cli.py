@@ -4,6 +4,15 @@ from google import genai
 from . import tools  # Import the tools module to register the tools
 from .logger import initialize_logging
 from .agent import Agent
+from .config import LLMConfig
+
+
+def positive_int(value: str) -> int:
+    """argparse type for options which must be a positive integer"""
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive integer")
+    return number
 
 
 def run_agent_main_entrypoint():
@@ -19,6 +28,12 @@ def run_agent_main_entrypoint():
     parser.add_argument("--project_id", required=True, type=str, help="provide gcp project id")
     parser.add_argument("--location", required=True, type=str, help="provide gcp project location")
     parser.add_argument("--model_name", default="gemini-2.5-flash", type=str, help="provide the gen ai model name / id")
+    parser.add_argument("--thinking_budget", default=None, type=int, help="thinking budget of the main model (-1 = dynamic, 0 = off, unset = model default)")
+    parser.add_argument("--routing_policy", default="tiered", choices=["single", "tiered"], help="send tool-selection hops to the routing model (tiered) or everything to the main model (single)")
+    parser.add_argument("--routing_model_name", default="gemini-2.5-flash-lite", type=str, help="provide the cheaper model used for tool-selection hops")
+    parser.add_argument("--routing_thinking_budget", default=None, type=int, help="thinking budget of the routing model (unset = model default)")
+    parser.add_argument("--code_workers", default=4, type=positive_int, help="number of code generation sub-agents running in parallel")
+    parser.add_argument("--code_worker_model_name", default=None, type=str, help="provide the model used by the code generation sub-agents (defaults to --model_name)")
 
     opts, pipeline_opts = parser.parse_known_args()
     logging.debug("opts: %s, unknown_opts: %s", opts, pipeline_opts)
@@ -28,7 +43,16 @@ def run_agent_main_entrypoint():
     # location=opts.location), get_user_message=get_user_message, tools=[])
 
     # Use: Google Gemini AI - API Key instead
-    agent = Agent(client=genai.Client(), get_user_message=get_user_message)
+    llm_config = LLMConfig(
+        MODEL_NAME=opts.model_name,
+        THINKING_BUDGET=opts.thinking_budget,
+        ROUTING_POLICY=opts.routing_policy,
+        ROUTING_MODEL_NAME=opts.routing_model_name,
+        ROUTING_THINKING_BUDGET=opts.routing_thinking_budget,
+        CODE_WORKERS=opts.code_workers,
+        CODE_WORKER_MODEL_NAME=opts.code_worker_model_name,
+    )
+    agent = Agent(client=genai.Client(), get_user_message=get_user_message, llm_config=llm_config)
 
     # Run the agent
     agent.run()
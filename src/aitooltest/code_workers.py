@@ -0,0 +1,145 @@
+import logging
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+from google import genai
+from .config import LLMConfig
+from .token_usage import TokenUsage
+
+CODE_WORKER_INSTRUCTION = (
+    "You are a focused code generation worker. Generate or refactor code exactly as instructed, "
+    "using the given code and file tree only as context. Respond with the final code only, "
+    "inside a single fenced code block, without any explanation."
+)
+
+_CODE_BLOCK_PATTERN = re.compile(r"```[^\n`]*\n(.*?)```", re.DOTALL)
+_OPENING_FENCE_PATTERN = re.compile(r"^```[^\n`]*\n", re.MULTILINE)
+
+
+def extract_code(text: str) -> str:
+    """Returns the first fenced code block of the response, or the whole response when there is none.
+    A block left unclosed is returned from its opening fence to the end of the text."""
+    match = _CODE_BLOCK_PATTERN.search(text)
+    if match:
+        return match.group(1).strip()
+    opening_fence = _OPENING_FENCE_PATTERN.search(text)
+    return (text[opening_fence.end():] if opening_fence else text).strip()
+
+
+class CodeWorkerPool:
+    """
+    Runs code generation requests as short-lived sub-agents on a bounded worker pool.
+    Each sub-agent gets its own chat and token budget, its usage is rolled up into the parent `TokenUsage`.
+    """
+
+    def __init__(self, client: genai.Client, llm_config: LLMConfig, token_usage: TokenUsage):
+        self._client = client
+        self._llm_config = llm_config
+        self._token_usage = token_usage
+        self._executor = ThreadPoolExecutor(max_workers=llm_config.CODE_WORKERS, thread_name_prefix="code-worker")
+
+    def submit(
+        self,
+        prompt: str,
+        existing_code: Optional[str] = None,
+        programming_language: Optional[str] = None,
+        file_tree_input: Optional[str] = None,
+    ) -> Future:
+        """Queue a code generation request, the future resolves to the final code.
+        Raises `ValueError` when the context does not fit the budget, a partial file would be refactored
+        and written back as if it were whole."""
+        context_chars = len(existing_code or "") + len(file_tree_input or "")
+        max_chars = self._llm_config.CODE_WORKER_MAX_CONTEXT_CHARS
+        if context_chars > max_chars:
+            raise ValueError(
+                f"existing_code and file_tree_input hold {context_chars} characters, over the {max_chars} "
+                "characters budget of a code worker. Send a smaller slice of the code (e.g. a single "
+                "function or class) and a shorter file tree."
+            )
+        return self._executor.submit(self._run, prompt, existing_code, programming_language, file_tree_input)
+
+    def _build_message(
+        self,
+        prompt: str,
+        existing_code: Optional[str],
+        programming_language: Optional[str],
+        file_tree_input: Optional[str],
+    ) -> str:
+        """Builds the context of the sub-agent, `submit` has already checked it fits the budget."""
+        sections = [f"Task: {prompt}"]
+        if programming_language:
+            sections.append(f"Language: {programming_language}")
+        if file_tree_input:
+            sections.append(f"Project file tree:\n{file_tree_input}")
+        if existing_code:
+            sections.append(f"Existing code:\n```\n{existing_code}\n```")
+        return "\n\n".join(sections)
+
+    def _run(
+        self,
+        prompt: str,
+        existing_code: Optional[str],
+        programming_language: Optional[str],
+        file_tree_input: Optional[str],
+    ) -> str:
+        """Runs a single sub-agent in its own chat and returns only its final code."""
+        model_name = self._llm_config.CODE_WORKER_MODEL_NAME or self._llm_config.MODEL_NAME
+        chat = self._client.chats.create(
+            model=model_name,
+            config=genai.types.GenerateContentConfig(
+                system_instruction=CODE_WORKER_INSTRUCTION,
+                max_output_tokens=self._llm_config.CODE_WORKER_MAX_OUTPUT_TOKENS,
+                thinking_config=(
+                    genai.types.ThinkingConfig(thinking_budget=self._llm_config.CODE_WORKER_THINKING_BUDGET)
+                    if self._llm_config.CODE_WORKER_THINKING_BUDGET is not None else None
+                ),
+            ),
+        )
+        response = chat.send_message(self._build_message(prompt, existing_code, programming_language, file_tree_input))
+        tokens = (response.usage_metadata.total_token_count if response.usage_metadata else None) or 0
+        self._token_usage.update_usage(tokens, source="code_worker")
+        logging.debug("code worker (%s) finished using %s tokens", model_name, tokens)
+
+        finish_reason = response.candidates[0].finish_reason if response.candidates else None
+        if finish_reason == genai.types.FinishReason.MAX_TOKENS:
+            raise RuntimeError(
+                f"Generated code was cut off at {self._llm_config.CODE_WORKER_MAX_OUTPUT_TOKENS} output tokens, "
+                "split the request into smaller parts."
+            )
+        code = extract_code(response.text or "")
+        if not code:
+            raise RuntimeError(f"Code worker returned no code (finish reason: {finish_reason}).")
+        return code
+
+    def shutdown(self):
+        """Wait for the queued requests and stop the workers."""
+        self._executor.shutdown(wait=True)
+
+
+# The pool used by the `generate_or_refactor_code` tool, owned by the running `Agent`
+_code_worker_pool: Optional[CodeWorkerPool] = None
+
+
+def start_code_workers(client: genai.Client, llm_config: LLMConfig, token_usage: TokenUsage) -> CodeWorkerPool:
+    """Start the session wide code worker pool."""
+    global _code_worker_pool
+    if _code_worker_pool is None:
+        _code_worker_pool = CodeWorkerPool(client, llm_config, token_usage)
+        logging.info("Code worker pool started with %s workers.", llm_config.CODE_WORKERS)
+    return _code_worker_pool
+
+
+def stop_code_workers():
+    """Stop the session wide code worker pool."""
+    global _code_worker_pool
+    if _code_worker_pool is not None:
+        _code_worker_pool.shutdown()
+        _code_worker_pool = None
+        logging.info("Code worker pool stopped.")
+
+
+def get_code_worker_pool() -> CodeWorkerPool:
+    """Get the running code worker pool."""
+    if _code_worker_pool is None:
+        raise RuntimeError("Code worker pool is not started, run it through the `Agent`.")
+    return _code_worker_pool
@@ -1,6 +1,22 @@
-from pydantic import BaseModel
+from typing import Literal, Optional
+from pydantic import BaseModel, Field
 
 
 class LLMConfig(BaseModel):
     MODEL_NAME: str = "gemini-2.5-flash"
-    THINKING_BUDGET: int = 0
+    # None leaves thinking to the model's default (and works for models without thinking),
+    # -1 asks for a dynamic budget, 0 turns thinking off
+    THINKING_BUDGET: Optional[int] = None
+
+    # `tiered` sends intermediate tool-selection hops to the cheaper routing model,
+    # `single` sends every turn to MODEL_NAME
+    ROUTING_POLICY: Literal["single", "tiered"] = "tiered"
+    ROUTING_MODEL_NAME: str = "gemini-2.5-flash-lite"
+    ROUTING_THINKING_BUDGET: Optional[int] = None
+
+    # Sub-agents backing `generate_or_refactor_code`, CODE_WORKER_MODEL_NAME falls back to MODEL_NAME
+    CODE_WORKERS: int = Field(default=4, gt=0)
+    CODE_WORKER_MODEL_NAME: Optional[str] = None
+    CODE_WORKER_THINKING_BUDGET: Optional[int] = None
+    CODE_WORKER_MAX_OUTPUT_TOKENS: int = 8192
+    CODE_WORKER_MAX_CONTEXT_CHARS: int = 60000
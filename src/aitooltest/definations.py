@@ -12,6 +12,8 @@ class ToolDefination(BaseModel):
     description: str
     input_schema: Type[BaseModel]
     function: Callable[[...], [Any,...]]
+    # Calls of the tool within a single model response may run concurrently
+    parallel: bool = False
 
     llm_config: LLMConfig = LLMConfig()
 
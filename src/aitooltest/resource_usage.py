@@ -0,0 +1,171 @@
+import logging
+import os
+import resource
+import threading
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+
+
+class CommandResourceUsage(BaseModel):
+    """Resource figures collected for a single command run by the agent"""
+    wall_time_seconds: float = 0.0
+    user_cpu_seconds: Optional[float] = None
+    system_cpu_seconds: Optional[float] = None
+    max_rss_kb: Optional[int] = None
+    stdout_bytes: int = 0
+    stderr_bytes: int = 0
+
+    @classmethod
+    def from_rusage(cls, rusage: resource.struct_rusage, wall_time_seconds: float, max_rss_kb: Optional[int],
+                    stdout_bytes: int, stderr_bytes: int) -> "CommandResourceUsage":
+        """Build the usage record from the `os.wait4` rusage of the child process.
+        `ru_maxrss` is not used, Linux carries the peak RSS of the forking agent across exec,
+        the memory comes from the `ProcessTreeSampler` of the command instead
+        (`None` when the command exits before its first sample)."""
+        return cls(
+            wall_time_seconds=round(wall_time_seconds, 3),
+            user_cpu_seconds=round(rusage.ru_utime, 3),
+            system_cpu_seconds=round(rusage.ru_stime, 3),
+            max_rss_kb=max_rss_kb,
+            stdout_bytes=stdout_bytes,
+            stderr_bytes=stderr_bytes,
+        )
+
+
+class ProcessTreeSampler:
+    """
+    Samples the CPU time and memory of a command and its live descendants from `/proc`, on a background thread.
+    Only the command's own process tree is walked, never the whole of `/proc`, and the interval backs off
+    from 10 ms up to 1 s so long-running commands are cheap to watch.
+    Only available on Linux, elsewhere the figures stay `None`.
+    """
+    _CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+    _PAGE_KB = resource.getpagesize() // 1024
+    _MIN_INTERVAL_SECONDS = 0.01
+    _MAX_INTERVAL_SECONDS = 1.0
+
+    def __init__(self, root_pid: int):
+        self.root_pid = root_pid
+        self.user_cpu_seconds: Optional[float] = None
+        self.system_cpu_seconds: Optional[float] = None
+        self.rss_kb: Optional[int] = None
+        self.max_rss_kb: Optional[int] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _read_vm_hwm_kb(pid: int) -> int:
+        """Peak RSS of a single process, it is tracked per address space so it starts afresh at exec."""
+        try:
+            with open(f"/proc/{pid}/status", "r") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+        return 0
+
+    @staticmethod
+    def _read_children(pid: int) -> List[int]:
+        """Direct children of every thread of the process."""
+        children = []
+        try:
+            for task in os.scandir(f"/proc/{pid}/task"):
+                with open(f"{task.path}/children", "r") as f:
+                    children.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+        return children
+
+    def sample(self):
+        """Take a sample of the tree; CPU includes the children its members have waited for."""
+        if not os.path.isdir("/proc"):
+            return
+        user_ticks = system_ticks = 0
+        rss_kb = hwm_kb = 0
+        pending = [self.root_pid]
+        while pending:
+            pid = pending.pop()
+            try:
+                with open(f"/proc/{pid}/stat", "r") as f:
+                    stat = f.read()
+            except OSError:
+                continue
+            # Fields after the `(comm)`, which itself may hold spaces or parentheses
+            fields = stat[stat.rindex(")") + 2:].split()
+            user_ticks += int(fields[11]) + int(fields[13])
+            system_ticks += int(fields[12]) + int(fields[14])
+            rss_kb += int(fields[21]) * self._PAGE_KB
+            hwm_kb = max(hwm_kb, self._read_vm_hwm_kb(pid))
+            pending.extend(self._read_children(pid))
+
+        # Members that exit without being waited for by the tree drop out, keep the figures monotonic
+        self.user_cpu_seconds = round(max(self.user_cpu_seconds or 0.0, user_ticks / self._CLOCK_TICKS), 3)
+        self.system_cpu_seconds = round(max(self.system_cpu_seconds or 0.0, system_ticks / self._CLOCK_TICKS), 3)
+        self.rss_kb = rss_kb
+        if rss_kb or hwm_kb:
+            self.max_rss_kb = max(self.max_rss_kb or 0, rss_kb, hwm_kb)
+
+    def _run(self):
+        """The main loop for the background thread."""
+        interval = self._MIN_INTERVAL_SECONDS
+        self.sample()
+        while not self._stopped.wait(interval):
+            self.sample()
+            interval = min(interval * 2, self._MAX_INTERVAL_SECONDS)
+
+    def start(self):
+        """Start sampling on a background thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop sampling and wait for the sample in flight."""
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+
+class CommandUsageReport:
+    """Thread-safe, session level aggregation of the resources burnt by executed commands."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records: List[Dict] = []
+
+    def record(self, command_id: str, command: str, usage: CommandResourceUsage):
+        """Add the usage of a finished command into the session report."""
+        with self._lock:
+            self._records.append({"command_id": command_id, "command": command, "usage": usage})
+
+    def summary(self) -> Dict:
+        """Get the aggregated usage along with the most expensive commands."""
+        with self._lock:
+            records = list(self._records)
+
+        def cpu_seconds(usage: CommandResourceUsage) -> float:
+            return (usage.user_cpu_seconds or 0.0) + (usage.system_cpu_seconds or 0.0)
+
+        top_commands = sorted(records, key=lambda r: cpu_seconds(r["usage"]), reverse=True)[:5]
+        return {
+            "commands_executed": len(records),
+            "wall_time_seconds": round(sum(r["usage"].wall_time_seconds for r in records), 3),
+            "user_cpu_seconds": round(sum(r["usage"].user_cpu_seconds or 0.0 for r in records), 3),
+            "system_cpu_seconds": round(sum(r["usage"].system_cpu_seconds or 0.0 for r in records), 3),
+            "peak_max_rss_kb": max((r["usage"].max_rss_kb or 0 for r in records), default=0),
+            "output_bytes": sum(r["usage"].stdout_bytes + r["usage"].stderr_bytes for r in records),
+            "top_cpu_commands": [
+                {"command_id": r["command_id"], "command": r["command"], "cpu_seconds": round(cpu_seconds(r["usage"]), 3)}
+                for r in top_commands
+            ],
+        }
+
+    def log_report(self):
+        """Log the session level command usage report."""
+        logging.info("Command resource usage for the session: %s", self.summary())
+
+
+# A session wide report shared by every command executed through `tools.py`
+command_usage_report = CommandUsageReport()
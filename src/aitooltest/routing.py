@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+from google import genai
+from pydantic import BaseModel
+from .config import LLMConfig
+from .token_usage import TokenUsage
+
+
+class ModelTier(BaseModel):
+    name: str
+    model_name: str
+    thinking_budget: Optional[int] = None
+
+
+def get_model_tiers(llm_config: LLMConfig) -> Dict[str, ModelTier]:
+    """Builds the `main` and `routing` tiers; with the `single` policy both point to the main model."""
+    main_tier = ModelTier(name="main", model_name=llm_config.MODEL_NAME, thinking_budget=llm_config.THINKING_BUDGET)
+    if llm_config.ROUTING_POLICY == "single":
+        return {"main": main_tier, "routing": main_tier}
+    routing_tier = ModelTier(
+        name="routing",
+        model_name=llm_config.ROUTING_MODEL_NAME,
+        thinking_budget=llm_config.ROUTING_THINKING_BUDGET,
+    )
+    return {"main": main_tier, "routing": routing_tier}
+
+
+class RoutingStats:
+    """Thread-safe latency and token stats for every model tier."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tiers: Dict[str, Dict] = {}
+        self._discarded_hops = {"calls": 0, "total_latency_seconds": 0.0, "total_tokens": 0}
+
+    def record(self, tier: ModelTier, latency_seconds: float, tokens: int):
+        """Record a single call made on the given tier."""
+        with self._lock:
+            stats = self._tiers.setdefault(tier.name, {
+                "model_name": tier.model_name,
+                "calls": 0,
+                "total_latency_seconds": 0.0,
+                "max_latency_seconds": 0.0,
+                "total_tokens": 0,
+            })
+            stats["calls"] += 1
+            stats["total_latency_seconds"] += latency_seconds
+            stats["max_latency_seconds"] = max(stats["max_latency_seconds"], latency_seconds)
+            stats["total_tokens"] += tokens
+
+    def record_discarded_hop(self, latency_seconds: float, tokens: int):
+        """Record a routing hop which turned out to be the final answer and was thrown away for the main tier.
+        Its call is also part of the routing tier stats, this tracks what escalating costs on top."""
+        with self._lock:
+            self._discarded_hops["calls"] += 1
+            self._discarded_hops["total_latency_seconds"] += latency_seconds
+            self._discarded_hops["total_tokens"] += tokens
+
+    def summary(self) -> Dict:
+        """Get the per tier stats in a thread-safe manner."""
+        with self._lock:
+            tiers = {
+                name: {
+                    **stats,
+                    "total_latency_seconds": round(stats["total_latency_seconds"], 3),
+                    "avg_latency_seconds": round(stats["total_latency_seconds"] / stats["calls"], 3),
+                    "max_latency_seconds": round(stats["max_latency_seconds"], 3),
+                }
+                for name, stats in self._tiers.items()
+            }
+            discarded_hops = {
+                **self._discarded_hops,
+                "total_latency_seconds": round(self._discarded_hops["total_latency_seconds"], 3),
+            }
+            return {"tiers": tiers, "discarded_hops": discarded_hops}
+
+    def log_report(self):
+        """Log the per tier stats for the session."""
+        logging.info("Model routing stats for the session: %s", self.summary())
+
+
+class TieredChat:
+    """
+    A chat session whose messages can be sent on different model tiers, sharing a single history.
+    User turns go to the `main` tier, the hops following tool results go to the cheap `routing` tier
+    and are escalated to the `main` tier once no more tools are needed.
+    """
+
+    def __init__(
+        self,
+        client: genai.Client,
+        tiers: Dict[str, ModelTier],
+        config_factory: Callable[[ModelTier], genai.types.GenerateContentConfig],
+        routing_stats: RoutingStats,
+        token_usage: TokenUsage,
+    ):
+        self._client = client
+        self._tiers = tiers
+        self._config_factory = config_factory
+        self._routing_stats = routing_stats
+        self._token_usage = token_usage
+        # Parallel tool calls may report their errors back on the chat at the same time
+        self._lock = threading.RLock()
+        self._chat = self._create_chat(tiers["main"], history=[])
+
+    def _create_chat(self, tier: ModelTier, history) -> genai.chats.Chat:
+        return self._client.chats.create(model=tier.model_name, config=self._config_factory(tier), history=history)
+
+    def _send(self, message: str, tier: ModelTier):
+        """Send the message on the tier and keep its turn in the history, returns the response, latency and tokens."""
+        with self._lock:
+            chat = self._create_chat(tier, history=list(self._chat.get_history()))
+            started_at = time.monotonic()
+            response = chat.send_message(message)
+            latency_seconds = time.monotonic() - started_at
+            tokens = (response.usage_metadata.total_token_count if response.usage_metadata else None) or 0
+            self._routing_stats.record(tier, latency_seconds, tokens)
+            self._token_usage.update_usage(tokens)
+            self._chat = chat
+            return response, latency_seconds, tokens
+
+    def send_message(self, message: str, tier: Optional[ModelTier] = None) -> genai.types.GenerateContentResponse:
+        """Send the message on the given tier (defaults to the routing tier) and keep its turn in the history."""
+        response, _, _ = self._send(message, tier or self._tiers["routing"])
+        return response
+
+    def send_user_message(self, message: str) -> genai.types.GenerateContentResponse:
+        """Send a user turn on the main tier, it either answers straight away or picks the first tools."""
+        return self.send_message(message, self._tiers["main"])
+
+    def send_tool_results(self, message: str) -> genai.types.GenerateContentResponse:
+        """
+        Send tool results on the routing tier while it keeps selecting tools,
+        once it stops calling tools, the hop is discarded and re-sent to the main tier for the final answer.
+        """
+        routing_tier, main_tier = self._tiers["routing"], self._tiers["main"]
+        if routing_tier == main_tier:
+            return self.send_message(message, main_tier)
+
+        with self._lock:
+            chat_before_hop = self._chat
+            response, latency_seconds, tokens = self._send(message, routing_tier)
+            if response.function_calls:
+                return response
+
+            self._chat = chat_before_hop
+            self._routing_stats.record_discarded_hop(latency_seconds, tokens)
+            return self.send_message(message, main_tier)
+
+    def get_history(self, curated: bool = False):
+        return self._chat.get_history(curated=curated)
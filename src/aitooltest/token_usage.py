@@ -1,33 +1,45 @@
 import logging
 import threading
 import queue
-from typing import Optional
+from typing import Dict, Optional
 from datetime import datetime
 
 class TokenUsage:
     def __init__(self):
         self._total_tokens = 0
+        self._tokens_by_source: Dict[str, int] = {}
         self._lock = threading.Lock()
         self._queue = queue.Queue()
         self._thread: Optional[threading.Thread] = None
 
-    def update_usage(self, current_tokens: int):
-        """Put the current token usage on the queue to be processed by the background thread."""
-        self._queue.put(current_tokens)
+    def update_usage(self, current_tokens: int, source: str = "agent"):
+        """Put the current token usage on the queue to be processed by the background thread.
+        `source` tells apart the main agent from the sub-agents rolling their usage up here."""
+        self._queue.put((current_tokens, source))
 
     def get_total_tokens(self) -> int:
         """Get the total token count in a thread-safe manner."""
         with self._lock:
             return self._total_tokens
 
+    def get_usage_by_source(self) -> Dict[str, int]:
+        """Get the token count of every source in a thread-safe manner."""
+        with self._lock:
+            return dict(self._tokens_by_source)
+
+    def _add_tokens(self, current_tokens: int, source: str):
+        """Add the tokens into the total and the source's count."""
+        with self._lock:
+            self._total_tokens += current_tokens
+            self._tokens_by_source[source] = self._tokens_by_source.get(source, 0) + current_tokens
+
     def _process_queue(self):
         """Process token updates from the queue."""
         while True:
             try:
-                current_tokens = self._queue.get_nowait()
-                with self._lock:
-                    self._total_tokens += current_tokens
-                logging.info(f"(Tokens: current={current_tokens}, total={self._total_tokens})")
+                current_tokens, source = self._queue.get_nowait()
+                self._add_tokens(current_tokens, source)
+                logging.info(f"(Tokens: source={source}, current={current_tokens}, total={self._total_tokens})")
                 self._queue.task_done()
             except queue.Empty:
                 break
@@ -37,12 +49,11 @@ class TokenUsage:
         while True:
             try:
                 # Block until an item is available or the thread is stopped
-                current_tokens = self._queue.get(timeout=1)
-                with self._lock:
-                    self._total_tokens += current_tokens
-                
+                current_tokens, source = self._queue.get(timeout=1)
+                self._add_tokens(current_tokens, source)
+
                 timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                logging.info(f"[{timestamp}] (Tokens: current={current_tokens}, total={self._total_tokens})")
+                logging.info(f"[{timestamp}] (Tokens: source={source}, current={current_tokens}, total={self._total_tokens})")
                 self._queue.task_done()
             except queue.Empty:
                 # This allows the thread to check if it should exit
@@ -69,5 +80,5 @@ class TokenUsage:
             # Wait for the thread to finish
             thread_to_join.join()
             
-            logging.info(f"Final total token usage for the session: {self.get_total_tokens()}")
+            logging.info(f"Final total token usage for the session: {self.get_total_tokens()} (by source: {self.get_usage_by_source()})")
             logging.info("Token usage tracker stopped.")
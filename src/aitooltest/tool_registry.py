@@ -1,25 +1,32 @@
 import inspect
 import logging
-from typing import Any, Callable, Dict, List
+from typing import Any, Callable, Dict, List, Optional
 from pydantic import create_model, Field
 from .definations import ToolDefination
 
 _tools: Dict[str, ToolDefination] = {}
 
 
-def tool(func: Callable[..., Any]) -> Callable[..., Any]:
+def tool(func: Optional[Callable[..., Any]] = None, *, parallel: bool = False) -> Callable[..., Any]:
     """
     A decorator to register a function as a tool.
+    Use `@tool(parallel=True)` for tools whose calls may run concurrently.
     """
+    if func is None:
+        return lambda f: tool(f, parallel=parallel)
+
     # Extract function signature and docstring
     sig = inspect.signature(func)
     doc = inspect.getdoc(func)
     if not doc:
         raise ValueError("Tool function must have a docstring.")
 
-    # Create Pydantic model from function signature
+    # Create Pydantic model from function signature, parameters with defaults stay optional
     fields = {
-        name: (param.annotation, Field(..., description=f"Description for {name}"))
+        name: (
+            param.annotation,
+            Field(... if param.default is inspect.Parameter.empty else param.default, description=f"Description for {name}"),
+        )
         for name, param in sig.parameters.items()
     }
     logging.debug(fields)
@@ -31,6 +38,7 @@ def tool(func: Callable[..., Any]) -> Callable[..., Any]:
         description=doc.strip(),
         input_schema=input_schema,
         function=func,
+        parallel=parallel,
     )
 
     # Register the tool
@@ -2,11 +2,16 @@ import logging
 import os
 import subprocess
 import pathspec
+import re
+import signal
 import threading
+import time
 import uuid
 from pathlib import Path
 from typing import Dict, Optional
 from .tool_registry import tool
+from .code_workers import get_code_worker_pool
+from .resource_usage import CommandResourceUsage, ProcessTreeSampler, command_usage_report
 
 
 @tool
@@ -114,79 +119,203 @@ def apply_patch(path: str, patch_content: str) -> Dict:
 # A dictionary to store running processes information
 running_commands = {}
 
-def _run_command_in_thread(command: str, command_id: str):
-    """Helper function to run a command in a separate thread."""
+# Upper bound of a single `wait_for_command`, so one tool call cannot block the agent indefinitely
+MAX_WAIT_TIMEOUT_SECONDS = 300.0
+
+
+def _with_resource_limits(command: str, cpu_time_limit: Optional[int], memory_limit_mb: Optional[int]) -> str:
+    """Prefixes the command with `ulimit`s, so the limits apply to the shell and everything it spawns."""
+    limits = []
+    if cpu_time_limit is not None:
+        limits.append(f"ulimit -t {int(cpu_time_limit)} || exit 1")
+    if memory_limit_mb is not None:
+        limits.append(f"ulimit -v {int(memory_limit_mb) * 1024} || exit 1")
+    return "\n".join(limits + [command])
+
+
+def _stream_output(stream, command_id: str, key: str):
+    """Helper function to stream a pipe of the process into the command's info."""
+    info = running_commands[command_id]
+    for line in iter(stream.readline, ''):
+        with info['output_updated']:
+            info[key].append(line)
+            info[f'{key}_bytes'] += len(line.encode('utf-8', errors='replace'))
+            info['output_updated'].notify_all()
+    stream.close()
+
+
+def _usage_snapshot(info: Dict) -> Dict:
+    """Resource usage of a command, sampled live from its process group while it runs."""
+    if info['usage'] is not None:
+        return info['usage'].model_dump()
+    sampler = info['sampler']
+    snapshot = CommandResourceUsage(
+        wall_time_seconds=round(time.monotonic() - info['started_at'], 3),
+        user_cpu_seconds=sampler.user_cpu_seconds if sampler else None,
+        system_cpu_seconds=sampler.system_cpu_seconds if sampler else None,
+        max_rss_kb=sampler.max_rss_kb if sampler else None,
+        stdout_bytes=info['stdout_bytes'],
+        stderr_bytes=info['stderr_bytes'],
+    ).model_dump()
+    snapshot['rss_kb'] = sampler.rss_kb if sampler else None
+    return snapshot
+
+
+def _register_command(command: str, description: Optional[str]) -> str:
+    """Adds a new command into `running_commands` and returns its command_id."""
+    command_id = str(uuid.uuid4())
+    running_commands[command_id] = {
+        'command': command,
+        'description': description,
+        'status': 'running',
+        'stdout': [],
+        'stderr': [],
+        'stdout_bytes': 0,
+        'stderr_bytes': 0,
+        'returncode': None,
+        'usage': None,
+        'started_at': time.monotonic(),
+        'thread': None,
+        'process': None,
+        'sampler': None,
+        # Wakes up `wait_for_command` on new output and on exit
+        'output_updated': threading.Condition(),
+        # Lines already handed out by `wait_for_command`
+        'stdout_cursor': 0,
+        'stderr_cursor': 0,
+    }
+    return command_id
+
+
+def _run_command(command: str, command_id: str, cpu_time_limit: Optional[int] = None, memory_limit_mb: Optional[int] = None):
+    """Helper function to run a command, stream its output and record its resource usage."""
+    info = running_commands[command_id]
     try:
         process = subprocess.Popen(
-            command,
+            _with_resource_limits(command, cpu_time_limit, memory_limit_mb),
             shell=True,
             cwd=os.getcwd(),
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
             encoding='utf-8',
-            errors='replace'
+            errors='replace',
+            # Own process group, to account for everything the command spawns and to stop it on shutdown
+            start_new_session=True,
         )
-        running_commands[command_id]['process'] = process
-
-        # Stream stdout and stderr
-        stdout_lines = []
-        stderr_lines = []
-
-        for line in iter(process.stdout.readline, ''):
-            stdout_lines.append(line)
-            running_commands[command_id]['stdout'] = "".join(stdout_lines)
-        
-        for line in iter(process.stderr.readline, ''):
-            stderr_lines.append(line)
-            running_commands[command_id]['stderr'] = "".join(stderr_lines)
-
-        process.stdout.close()
-        process.stderr.close()
-        process.wait()
-        
-        running_commands[command_id]['returncode'] = process.returncode
-        running_commands[command_id]['status'] = 'completed'
+        info['process'] = process
+        sampler = ProcessTreeSampler(process.pid)
+        info['sampler'] = sampler
+        sampler.start()
+
+        # Stream stdout and stderr concurrently, so neither pipe can fill up and block the child
+        readers = [
+            threading.Thread(target=_stream_output, args=(process.stdout, command_id, 'stdout'), daemon=True),
+            threading.Thread(target=_stream_output, args=(process.stderr, command_id, 'stderr'), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+
+        # Block until the child exits without reaping it, so the sampler never reads a reused pid,
+        # then reap it ourselves to get its rusage (includes the CPU of the children it waited for)
+        if hasattr(os, "waitid"):
+            os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+        sampler.stop()
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        for reader in readers:
+            reader.join()
+
+        info['usage'] = CommandResourceUsage.from_rusage(
+            rusage,
+            wall_time_seconds=time.monotonic() - info['started_at'],
+            max_rss_kb=sampler.max_rss_kb,
+            stdout_bytes=info['stdout_bytes'],
+            stderr_bytes=info['stderr_bytes'],
+        )
+        command_usage_report.record(command_id, command, info['usage'])
+        with info['output_updated']:
+            info['returncode'] = process.returncode
+            info['status'] = 'completed'
+            info['output_updated'].notify_all()
     except Exception as e:
-        running_commands[command_id]['status'] = 'error'
-        running_commands[command_id]['stderr'] = str(e)
-        running_commands[command_id]['returncode'] = 1
+        with info['output_updated']:
+            info['status'] = 'error'
+            info['stderr'].append(str(e))
+            info['returncode'] = 1
+            info['output_updated'].notify_all()
 
 
 @tool
-def execute_command(command: str, description: Optional[str] = None, wait: bool = False) -> Dict:
+def execute_command(
+    command: str,
+    description: Optional[str] = None,
+    wait: bool = False,
+    cpu_time_limit: Optional[int] = None,
+    memory_limit_mb: Optional[int] = None,
+) -> Dict:
     """
     Execute a given command.
     By default, it runs in the background and returns a command_id.
     Set `wait=True` to run it in the foreground and wait for completion.
+    Optionally limit the CPU time (seconds) and memory (MB) the command may use.
     """
-    logging.debug("execute_command: %s, description=%s, wait=%s", command, description, wait)
+    logging.debug(
+        "execute_command: %s, description=%s, wait=%s, cpu_time_limit=%s, memory_limit_mb=%s",
+        command, description, wait, cpu_time_limit, memory_limit_mb,
+    )
 
     if wait:
-        result = subprocess.run(command, shell=True, cwd=os.getcwd(), capture_output=True, text=True)
-        stdout = result.stdout.strip()
-        stderr = result.stderr.strip()
-        return {"STDOUT": stdout, "STDERR": stderr, "returncode": str(result.returncode)}
-
-    command_id = str(uuid.uuid4())
-    thread = threading.Thread(target=_run_command_in_thread, args=(command, command_id))
-    
-    running_commands[command_id] = {
-        'command': command,
-        'description': description,
-        'status': 'running',
-        'stdout': '',
-        'stderr': '',
-        'returncode': None,
-        'thread': thread,
-        'process': None,
-    }
-    
+        command_id = _register_command(command, description)
+        _run_command(command, command_id, cpu_time_limit, memory_limit_mb)
+        info = running_commands[command_id]
+        return {
+            "STDOUT": "".join(info['stdout']).strip(),
+            "STDERR": "".join(info['stderr']).strip(),
+            "returncode": str(info['returncode']),
+            "usage": _usage_snapshot(info),
+        }
+
+    command_id = _register_command(command, description)
+    thread = threading.Thread(target=_run_command, args=(command, command_id, cpu_time_limit, memory_limit_mb))
+    running_commands[command_id]['thread'] = thread
     thread.start()
-    
+
     return {"status": "started", "command_id": command_id}
 
 
+def _signal_process_group(pgid: int, sig: int) -> bool:
+    """Sends the signal to the process group, returns whether the group still exists."""
+    try:
+        os.killpg(pgid, sig)
+        return True
+    except ProcessLookupError:
+        return False
+
+
+def stop_running_commands(grace_period_seconds: float = 3.0):
+    """
+    Terminate the process groups of the commands still running, so they do not outlive the agent.
+    Groups which are still alive after the grace period are killed.
+    """
+    pgids = {}
+    for command_id, info in list(running_commands.items()):
+        process = info['process']
+        if info['status'] == 'running' and process is not None:
+            logging.info("stopping command %s: %s", command_id, info['command'])
+            if _signal_process_group(process.pid, signal.SIGTERM):
+                pgids[command_id] = process.pid
+
+    deadline = time.monotonic() + grace_period_seconds
+    while pgids and time.monotonic() < deadline:
+        time.sleep(0.05)
+        pgids = {command_id: pgid for command_id, pgid in pgids.items() if _signal_process_group(pgid, 0)}
+
+    for command_id, pgid in pgids.items():
+        logging.warning("command %s is still running after SIGTERM, killing it", command_id)
+        _signal_process_group(pgid, signal.SIGKILL)
+
+
 @tool
 def check_command(command_id: str) -> Dict:
     """
@@ -195,23 +324,96 @@ def check_command(command_id: str) -> Dict:
     logging.debug("check_command: %s", command_id)
     if command_id not in running_commands:
         return {"status": "error", "message": "Command ID not found."}
-    
+
     info = running_commands[command_id]
     return {
         "command": info['command'],
         "description": info['description'],
         "status": info['status'],
-        "stdout": info['stdout'],
-        "stderr": info['stderr'],
+        "stdout": "".join(info['stdout']),
+        "stderr": "".join(info['stderr']),
         "returncode": info['returncode'],
+        "usage": _usage_snapshot(info),
     }
 
 
+@tool
+def wait_for_command(
+    command_id: str,
+    pattern: Optional[str] = None,
+    timeout_seconds: float = 30.0,
+    max_output_chars: int = 4000,
+) -> Dict:
+    """
+    Block until a command started with `execute_command` exits, a regex `pattern` matches
+    a new line of its stdout or stderr (e.g. "Listening on" or "FAILED"), or `timeout_seconds`
+    (at most 300) expires. Returns only the output produced since the previous `wait_for_command` call,
+    up to the moment the match was seen, keeping the last `max_output_chars` of each stream.
+    Prefer this over polling `check_command` repeatedly.
+    """
+    logging.debug("wait_for_command: %s, pattern=%s, timeout_seconds=%s", command_id, pattern, timeout_seconds)
+    timeout_seconds = min(max(timeout_seconds, 0.0), MAX_WAIT_TIMEOUT_SECONDS)
+    max_output_chars = max(max_output_chars, 0)
+    if command_id not in running_commands:
+        return {"status": "error", "message": "Command ID not found."}
+    try:
+        regex = re.compile(pattern) if pattern else None
+    except re.error as e:
+        return {"status": "error", "message": f"Invalid pattern: {e}"}
+
+    info = running_commands[command_id]
+    deadline = time.monotonic() + timeout_seconds
+    streams = ('stdout', 'stderr')
+    scanned = {key: info[f'{key}_cursor'] for key in streams}
+    matched_line = None
+
+    with info['output_updated']:
+        while True:
+            # Scan every line of both streams which arrived since the last wake up,
+            # the readers append under the same condition so nothing lands mid-scan
+            for key in streams:
+                lines = info[key]
+                while scanned[key] < len(lines):
+                    line = lines[scanned[key]]
+                    scanned[key] += 1
+                    if matched_line is None and regex is not None and regex.search(line):
+                        matched_line = line.rstrip("\n")
+            if matched_line is not None:
+                reason = "matched"
+                break
+            if info['status'] != 'running':
+                reason = "exited"
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                reason = "timeout"
+                break
+            info['output_updated'].wait(remaining)
+
+        # Hand out the output up to the wake up and move the cursors past it
+        output = {}
+        for key in streams:
+            end = len(info[key])
+            text = "".join(info[key][info[f'{key}_cursor']:end])
+            output[key] = text[-max_output_chars:] if max_output_chars > 0 else ""
+            info[f'{key}_cursor'] = end
+
+        return {
+            "status": info['status'],
+            "reason": reason,
+            "matched_line": matched_line,
+            "stdout": output['stdout'],
+            "stderr": output['stderr'],
+            "returncode": info['returncode'],
+            "usage": _usage_snapshot(info),
+        }
+
+
 @tool
 def list_running_commands() -> Dict[str, Dict]:
     """List all currently running commands."""
     logging.debug("list_running_commands")
-    
+
     serializable_commands = {}
     for cmd_id, info in running_commands.items():
         if info['status'] == 'running':
@@ -219,19 +421,29 @@ def list_running_commands() -> Dict[str, Dict]:
                 'command': info['command'],
                 'description': info['description'],
                 'status': info['status'],
+                'usage': _usage_snapshot(info),
             }
     return serializable_commands
 
 
 @tool
+def get_command_usage_report() -> Dict:
+    """Report the CPU time, memory and output produced by all the commands executed in this session."""
+    logging.debug("get_command_usage_report")
+    return command_usage_report.summary()
+
+
+@tool(parallel=True)
 def generate_or_refactor_code(
     prompt: str,
     existing_code: Optional[str] = None,
-    programming_language: str = None,
+    programming_language: Optional[str] = None,
     file_tree_input: Optional[str] = None,
-) -> str:
+) -> Dict:
     """
-    Generate or refactor code based on a prompt.
+    Generate or refactor code based on a prompt, delegated to a code generation sub-agent.
+    Several calls in one response run in parallel, pass the relevant code and file tree as context.
+    The code and file tree must fit in about 60k characters together, send one slice of a larger file at a time.
 
     Args:
         prompt: The instruction for code generation/refactoring.
@@ -242,13 +454,16 @@ def generate_or_refactor_code(
     Returns:
         The generated or refactored code.
     """
-    # This is a placeholder for the actual implementation.
-    # In a real scenario, this would call a code generation model.
     logging.debug(
-        "generate_or_refactor_code: %s, %s, %s, %s",
+        "generate_or_refactor_code: %s, language=%s, existing_code=%s chars, file_tree_input=%s chars",
         prompt,
-        existing_code,
         programming_language,
-        file_tree_input,
+        len(existing_code or ""),
+        len(file_tree_input or ""),
     )
-    return "Generated or refactored code will appear here."
+    try:
+        code = get_code_worker_pool().submit(prompt, existing_code, programming_language, file_tree_input).result()
+    except Exception as e:
+        logging.error("generate_or_refactor_code failed: %s", e)
+        return {"status": "ERROR", "message": str(e)}
+    return {"status": "OK", "code": code}